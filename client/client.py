@@ -5,17 +5,187 @@ This client connects to MCP servers and demonstrates basic interactions.
 """
 
 import asyncio
+import functools
 import json
 import subprocess
 import sys
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import logging
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Prefer orjson for the RPC hot path; fall back to the stdlib when unavailable
+try:
+    import orjson
+
+    dumps = orjson.dumps
+    loads = orjson.loads
+except ImportError:
+    def dumps(obj: Any) -> bytes:
+        """Serialize obj to compact JSON bytes"""
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    loads = json.loads
+
+def request_template(method: str, params: Optional[Dict[str, Any]] = None) -> bytes:
+    """Serialize a fixed-shape request once, leaving a %d placeholder for its id"""
+    template = b'{"jsonrpc":"2.0","id":%d,"method":' + dumps(method).replace(b"%", b"%%")
+    if params:
+        template += b',"params":' + dumps(params).replace(b"%", b"%%")
+    return template + b"}\n"
+
+# Requests whose payload never changes; only the id is spliced in per call
+INITIALIZE_REQUEST = request_template("initialize", {
+    "protocolVersion": "2024-11-05",
+    "capabilities": {},
+    "clientInfo": {
+        "name": "tutorial-mcp-client",
+        "version": "1.0.0"
+    }
+})
+TOOLS_LIST_REQUEST = request_template("tools/list")
+RESOURCES_LIST_REQUEST = request_template("resources/list")
+PROMPTS_LIST_REQUEST = request_template("prompts/list")
+
+# Argument types whose values encode identically whenever they compare equal (with
+# the type in the key); floats (0.0 == -0.0), containers and subclasses are not cached
+CACHEABLE_ARGUMENT_TYPES = frozenset((str, int, bool, type(None)))
+
+@functools.lru_cache(maxsize=256)
+def tool_call_template(tool_name: str, arguments: Tuple[Tuple[str, type, Any], ...]) -> bytes:
+    """Cached tools/call request template for a tool and its (name, type, value) arguments"""
+    return request_template("tools/call", {
+        "name": tool_name,
+        "arguments": {name: value for name, _, value in arguments}
+    })
+
+def tool_call_key(arguments: Dict[str, Any]) -> Optional[Tuple[Tuple[str, type, Any], ...]]:
+    """tool_call_template() key for arguments, or None if they can't be cached exactly"""
+    for name, value in arguments.items():
+        if type(name) is not str or type(value) not in CACHEABLE_ARGUMENT_TYPES:
+            return None
+    # Key on value types too so that e.g. 1 and True don't share a cache entry
+    return tuple(sorted((name, type(value), value) for name, value in arguments.items()))
+
+# Kernel buffer size requested for the pipes to and from the server
+PIPE_BUFFER_SIZE = 1 << 20
+
+def grow_pipe_buffer(pipe_transport: Optional[asyncio.BaseTransport]) -> bool:
+    """Enlarge a pipe's kernel buffer so large messages cross it in fewer reads (Linux only)"""
+    if fcntl is None or not hasattr(fcntl, "F_SETPIPE_SZ") or pipe_transport is None:
+        return False
+    
+    pipe = pipe_transport.get_extra_info("pipe")
+    if pipe is None:
+        return False
+    
+    try:
+        fcntl.fcntl(pipe.fileno(), fcntl.F_SETPIPE_SZ, PIPE_BUFFER_SIZE)
+    except OSError:
+        # Unprivileged processes are capped at /proc/sys/fs/pipe-max-size
+        return False
+    return True
+
+def install_uvloop() -> bool:
+    """Use uvloop's libuv-based event loop for asyncio.run() when it is installed"""
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+class MCPClientProtocol(asyncio.SubprocessProtocol):
+    """Subprocess protocol that frames newline-delimited responses off the server's stdout"""
+    
+    def __init__(self, on_response: Callable[[bytearray], None], on_close: Callable[[], None]):
+        self._on_response = on_response
+        self._on_close = on_close
+        self._buffer = bytearray()
+        self._paused = False
+        self._drain_waiter: Optional[asyncio.Future] = None
+        self._exited = asyncio.get_running_loop().create_future()
+    
+    def pipe_data_received(self, fd: int, data: bytes):
+        """Split complete lines out of the stdout buffer and hand them on"""
+        if fd != 1:
+            # stderr only carries the server's log output
+            return
+        
+        # Every response that arrived in this read is dispatched before returning.
+        # Lines are sliced straight out of the chunk; only a trailing partial line
+        # is carried over in the buffer, which is compacted once per read.
+        buffer = self._buffer
+        if buffer:
+            buffer += data
+            data = buffer
+        
+        start = 0
+        end = data.find(b"\n")
+        while end != -1:
+            line = data[start:end]
+            if line and not line.isspace():
+                # A bad line must not escape into the transport: the buffer would
+                # never be compacted and the line would be re-dispatched next read
+                try:
+                    self._on_response(line)
+                except Exception as e:
+                    logging.error(f"Failed to handle response line: {e}")
+            start = end + 1
+            end = data.find(b"\n", start)
+        
+        if data is buffer:
+            del buffer[:start]
+        elif start < len(data):
+            buffer += data[start:]
+    
+    def pipe_connection_lost(self, fd: int, exc: Optional[Exception]):
+        """Treat a closed stdout pipe as a closed connection"""
+        if fd == 1:
+            self._on_close()
+    
+    def process_exited(self):
+        """Wake up anyone waiting for the server to exit"""
+        if not self._exited.done():
+            self._exited.set_result(None)
+    
+    def pause_writing(self):
+        """Stop writers until the stdin pipe buffer drains"""
+        self._paused = True
+    
+    def resume_writing(self):
+        """Release writers blocked in drain()"""
+        self._paused = False
+        waiter, self._drain_waiter = self._drain_waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+    
+    async def drain(self):
+        """Wait until the stdin pipe accepts more data"""
+        if not self._paused:
+            return
+        if self._drain_waiter is None:
+            self._drain_waiter = asyncio.get_running_loop().create_future()
+        await self._drain_waiter
+    
+    async def wait_exited(self):
+        """Wait for the server process to exit"""
+        await self._exited
+
 class MCPClient:
     def __init__(self):
         self.request_id = 0
-        self.process = None
+        self.transport: Optional[asyncio.SubprocessTransport] = None
+        self.protocol: Optional[MCPClientProtocol] = None
         self.initialized = False
+        self._server_closed = False
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
         
     def get_next_id(self) -> int:
         """Get next request ID"""
@@ -25,68 +195,123 @@ class MCPClient:
     async def connect_to_server(self, server_command: List[str]) -> bool:
         """Connect to MCP server using subprocess"""
         try:
-            self.process = await asyncio.create_subprocess_exec(
+            self._server_closed = False
+            loop = asyncio.get_running_loop()
+            self.transport, self.protocol = await loop.subprocess_exec(
+                lambda: MCPClientProtocol(self._dispatch_response, self._connection_lost),
                 *server_command,
                 stdin=asyncio.subprocess.PIPE,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE,
                 cwd="."
             )
-            # Give the server a moment to start
-            await asyncio.sleep(0.1)
+            grow_pipe_buffer(self.transport.get_pipe_transport(0))
+            grow_pipe_buffer(self.transport.get_pipe_transport(1))
+            self._write_queue = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._write_loop())
+            # No startup delay needed: the stdin pipe buffers requests until the
+            # server reads them, and initialize() waits for its response anyway
             return True
         except Exception as e:
             logging.error(f"Failed to connect to server: {e}")
             return False
     
+    async def _write_loop(self):
+        """Coalesce requests queued within the same event-loop tick into one write"""
+        queue = self._write_queue
+        stdin = self.transport.get_pipe_transport(0)
+        protocol = self.protocol
+        
+        while True:
+            data, waiter = await queue.get()
+            chunks = [data]
+            waiters = [waiter]
+            while not queue.empty():
+                data, waiter = queue.get_nowait()
+                chunks.append(data)
+                waiters.append(waiter)
+            
+            try:
+                stdin.write(b"".join(chunks))
+                await protocol.drain()
+            except Exception as e:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+    
+    def _dispatch_response(self, line: bytearray):
+        """Resolve the request waiting on the id of a response line"""
+        try:
+            response = loads(line)
+        except json.JSONDecodeError as e:
+            logging.error(f"Invalid JSON response: {e}")
+            return
+        if not isinstance(response, dict):
+            logging.error(f"Invalid response, expected a JSON object: {line[:80]!r}")
+            return
+        
+        waiter = self._pending.pop(response.get("id"), None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(response)
+    
+    def _connection_lost(self):
+        """Fail outstanding requests once the server stops responding"""
+        self._server_closed = True
+        self._fail_pending(Exception("Server closed connection"))
+    
+    def _fail_pending(self, error: Exception):
+        """Fail every request still waiting for a response"""
+        pending, self._pending = self._pending, {}
+        for waiter in pending.values():
+            if not waiter.done():
+                waiter.set_exception(error)
+    
     async def send_request(self, method: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Send a request to the MCP server"""
-        if not self.process:
-            raise Exception("Not connected to server")
-        
+        request_id = self.get_next_id()
         request = {
             "jsonrpc": "2.0",
-            "id": self.get_next_id(),
+            "id": request_id,
             "method": method
         }
         
         if params:
             request["params"] = params
         
-        # Send request
-        request_line = json.dumps(request) + "\n"
-        self.process.stdin.write(request_line.encode())
-        await self.process.stdin.drain()
+        return await self._send(request_id, dumps(request) + b"\n")
+    
+    async def send_template(self, template: bytes) -> Dict[str, Any]:
+        """Send a pre-serialized request built by request_template()"""
+        request_id = self.get_next_id()
+        return await self._send(request_id, template % request_id)
+    
+    async def _send(self, request_id: int, data: bytes) -> Dict[str, Any]:
+        """Queue an encoded request and wait for the response carrying its id"""
+        if not self.transport:
+            raise Exception("Not connected to server")
+        if self._server_closed:
+            raise Exception("Server closed connection")
+        
+        # Register the waiter before writing so the reader can never miss the response
+        waiter = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = waiter
+        self._write_queue.put_nowait((data, waiter))
         
-        # Read response with timeout
         try:
-            response_line = await asyncio.wait_for(
-                self.process.stdout.readline(), 
-                timeout=10.0
-            )
-            if not response_line:
-                raise Exception("Server closed connection")
-            
-            return json.loads(response_line.decode().strip())
+            return await asyncio.wait_for(waiter, timeout=10.0)
         except asyncio.TimeoutError:
             raise Exception("Request timed out")
-        except json.JSONDecodeError as e:
-            raise Exception(f"Invalid JSON response: {e}")
+        finally:
+            self._pending.pop(request_id, None)
     
     async def initialize(self) -> bool:
         """Initialize connection with the server"""
         try:
-            response = await self.send_request("initialize", {
-                "protocolVersion": "2024-11-05",
-                "capabilities": {},
-                "clientInfo": {
-                    "name": "tutorial-mcp-client",
-                    "version": "1.0.0"
-                }
-            })
+            response = await self.send_template(INITIALIZE_REQUEST)
             
-            if "error" in response:
-                logging.error(f"Initialization failed: {response['error']}")
+            error = response.get("error")
+            if error is not None:
+                logging.error(f"Initialization failed: {error}")
                 return False
             
             self.initialized = True
@@ -102,10 +327,11 @@ class MCPClient:
         if not self.initialized:
             raise Exception("Client not initialized")
         
-        response = await self.send_request("tools/list")
+        response = await self.send_template(TOOLS_LIST_REQUEST)
         
-        if "error" in response:
-            raise Exception(f"Error listing tools: {response['error']}")
+        error = response.get("error")
+        if error is not None:
+            raise Exception(f"Error listing tools: {error}")
         
         return response["result"]["tools"]
     
@@ -114,29 +340,33 @@ class MCPClient:
         if not self.initialized:
             raise Exception("Client not initialized")
         
-        response = await self.send_request("tools/call", {
-            "name": tool_name,
-            "arguments": arguments
-        })
+        key = tool_call_key(arguments)
+        if key is not None:
+            response = await self.send_template(tool_call_template(tool_name, key))
+        else:
+            response = await self.send_request("tools/call", {
+                "name": tool_name,
+                "arguments": arguments
+            })
         
-        if "error" in response:
-            raise Exception(f"Error calling tool: {response['error']}")
+        error = response.get("error")
+        if error is not None:
+            raise Exception(f"Error calling tool: {error}")
         
         # Extract text from response
-        content = response["result"]["content"]
-        if content and len(content) > 0:
-            return content[0]["text"]
-        return ""
+        content = response["result"].get("content")
+        return content[0]["text"] if content else ""
     
     async def list_resources(self) -> List[Dict[str, Any]]:
         """List available resources from the server"""
         if not self.initialized:
             raise Exception("Client not initialized")
         
-        response = await self.send_request("resources/list")
+        response = await self.send_template(RESOURCES_LIST_REQUEST)
         
-        if "error" in response:
-            raise Exception(f"Error listing resources: {response['error']}")
+        error = response.get("error")
+        if error is not None:
+            raise Exception(f"Error listing resources: {error}")
         
         return response["result"]["resources"]
     
@@ -149,23 +379,23 @@ class MCPClient:
             "uri": uri
         })
         
-        if "error" in response:
-            raise Exception(f"Error reading resource: {response['error']}")
+        error = response.get("error")
+        if error is not None:
+            raise Exception(f"Error reading resource: {error}")
         
-        contents = response["result"]["contents"]
-        if contents and len(contents) > 0:
-            return contents[0]["text"]
-        return ""
+        contents = response["result"].get("contents")
+        return contents[0]["text"] if contents else ""
     
     async def list_prompts(self) -> List[Dict[str, Any]]:
         """List available prompts from the server"""
         if not self.initialized:
             raise Exception("Client not initialized")
         
-        response = await self.send_request("prompts/list")
+        response = await self.send_template(PROMPTS_LIST_REQUEST)
         
-        if "error" in response:
-            raise Exception(f"Error listing prompts: {response['error']}")
+        error = response.get("error")
+        if error is not None:
+            raise Exception(f"Error listing prompts: {error}")
         
         return response["result"]["prompts"]
     
@@ -180,20 +410,27 @@ class MCPClient:
         
         response = await self.send_request("prompts/get", params)
         
-        if "error" in response:
-            raise Exception(f"Error getting prompt: {response['error']}")
+        error = response.get("error")
+        if error is not None:
+            raise Exception(f"Error getting prompt: {error}")
         
-        messages = response["result"]["messages"]
-        if messages and len(messages) > 0:
-            return messages[0]["content"]["text"]
-        return ""
+        messages = response["result"].get("messages")
+        return messages[0]["content"]["text"] if messages else ""
     
     async def disconnect(self):
         """Disconnect from the server"""
-        if self.process:
-            self.process.terminate()
-            await self.process.wait()
-            self.process = None
+        if self._writer_task:
+            self._writer_task.cancel()
+            self._writer_task = None
+            self._write_queue = None
+        if self.transport:
+            if self.transport.get_returncode() is None:
+                self.transport.terminate()
+            await self.protocol.wait_exited()
+            self.transport.close()
+            self.transport = None
+            self.protocol = None
+        self._fail_pending(Exception("Disconnected from server"))
         self.initialized = False
 
 async def demo_client():
@@ -216,43 +453,40 @@ async def demo_client():
         return
     
     try:
+        # None of the demo calls depend on each other, so issue them all at once
+        # and let the pipelined transport carry them over the pipe together
+        (
+            tools, echo_result, calc_result, time_result,
+            resources, greeting, system_info,
+            prompts, prompt
+        ) = await asyncio.gather(
+            client.list_tools(),
+            client.call_tool("echo", {"message": "Hello, MCP!"}),
+            client.call_tool("calculate", {"expression": "10 + 5 * 2"}),
+            client.call_tool("get_time", {}),
+            client.list_resources(),
+            client.read_resource("resource://greeting"),
+            client.read_resource("resource://system_info"),
+            client.list_prompts(),
+            client.get_prompt("helpful_assistant", {"topic": "Python programming"})
+        )
+        
         # List and demonstrate tools
         print("\n=== TOOLS ===")
-        tools = await client.list_tools()
         print(f"Available tools: {[tool['name'] for tool in tools]}")
-        
-        # Test echo tool
-        echo_result = await client.call_tool("echo", {"message": "Hello, MCP!"})
         print(f"Echo tool result: {echo_result}")
-        
-        # Test calculate tool
-        calc_result = await client.call_tool("calculate", {"expression": "10 + 5 * 2"})
         print(f"Calculate tool result: {calc_result}")
-        
-        # Test get_time tool
-        time_result = await client.call_tool("get_time", {})
         print(f"Get time tool result: {time_result}")
         
         # List and demonstrate resources
         print("\n=== RESOURCES ===")
-        resources = await client.list_resources()
         print(f"Available resources: {[resource['name'] for resource in resources]}")
-        
-        # Read greeting resource
-        greeting = await client.read_resource("resource://greeting")
         print(f"Greeting resource: {greeting}")
-        
-        # Read system info resource
-        system_info = await client.read_resource("resource://system_info")
         print(f"System info resource: {system_info}")
         
         # List and demonstrate prompts
         print("\n=== PROMPTS ===")
-        prompts = await client.list_prompts()
         print(f"Available prompts: {[prompt['name'] for prompt in prompts]}")
-        
-        # Get helpful assistant prompt
-        prompt = await client.get_prompt("helpful_assistant", {"topic": "Python programming"})
         print(f"Helpful assistant prompt: {prompt}")
         
     except Exception as e:
@@ -262,6 +496,79 @@ async def demo_client():
         await client.disconnect()
         print("\nDisconnected from server")
 
+async def _cmd_help(client: MCPClient, arg: str):
+    """Print the interactive command reference"""
+    print("Commands:")
+    print("  tools - List available tools")
+    print("  echo <message> - Test echo tool")
+    print("  calc <expression> - Test calculator tool")
+    print("  time - Get current time")
+    print("  resources - List available resources")
+    print("  greeting - Read greeting resource")
+    print("  sysinfo - Read system info resource")
+    print("  prompts - List available prompts")
+    print("  quit - Exit")
+
+async def _cmd_tools(client: MCPClient, arg: str):
+    """List available tools"""
+    tools = await client.list_tools()
+    for tool in tools:
+        print(f"  {tool['name']}: {tool['description']}")
+
+async def _cmd_echo(client: MCPClient, arg: str):
+    """Call the echo tool"""
+    result = await client.call_tool("echo", {"message": arg})
+    print(f"Result: {result}")
+
+async def _cmd_calc(client: MCPClient, arg: str):
+    """Call the calculator tool"""
+    result = await client.call_tool("calculate", {"expression": arg})
+    print(f"Result: {result}")
+
+async def _cmd_time(client: MCPClient, arg: str):
+    """Call the get_time tool"""
+    result = await client.call_tool("get_time", {})
+    print(f"Current time: {result}")
+
+async def _cmd_resources(client: MCPClient, arg: str):
+    """List available resources"""
+    resources = await client.list_resources()
+    for resource in resources:
+        print(f"  {resource['name']}: {resource['description']}")
+
+async def _cmd_greeting(client: MCPClient, arg: str):
+    """Read the greeting resource"""
+    result = await client.read_resource("resource://greeting")
+    print(f"Greeting: {result}")
+
+async def _cmd_sysinfo(client: MCPClient, arg: str):
+    """Read the system info resource"""
+    result = await client.read_resource("resource://system_info")
+    print(f"System info: {result}")
+
+async def _cmd_prompts(client: MCPClient, arg: str):
+    """List available prompts"""
+    prompts = await client.list_prompts()
+    for prompt in prompts:
+        print(f"  {prompt['name']}: {prompt['description']}")
+
+async def _cmd_unknown(client: MCPClient, arg: str):
+    """Fallback for unrecognised input"""
+    print("Unknown command. Type 'help' for available commands.")
+
+# Interactive commands keyed by (verb, takes_argument)
+INTERACTIVE_COMMANDS = {
+    ("help", False): _cmd_help,
+    ("tools", False): _cmd_tools,
+    ("echo", True): _cmd_echo,
+    ("calc", True): _cmd_calc,
+    ("time", False): _cmd_time,
+    ("resources", False): _cmd_resources,
+    ("greeting", False): _cmd_greeting,
+    ("sysinfo", False): _cmd_sysinfo,
+    ("prompts", False): _cmd_prompts,
+}
+
 async def interactive_client():
     """Interactive MCP client for testing"""
     client = MCPClient()
@@ -284,52 +591,14 @@ async def interactive_client():
     
     try:
         while True:
-            command = input("\n> ").strip().lower()
+            verb, _, arg = input("\n> ").strip().partition(" ")
+            command = (verb.lower(), bool(arg))
             
-            if command == "quit":
+            if command == ("quit", False):
                 break
-            elif command == "help":
-                print("Commands:")
-                print("  tools - List available tools")
-                print("  echo <message> - Test echo tool")
-                print("  calc <expression> - Test calculator tool")
-                print("  time - Get current time")
-                print("  resources - List available resources")
-                print("  greeting - Read greeting resource")
-                print("  sysinfo - Read system info resource")
-                print("  prompts - List available prompts")
-                print("  quit - Exit")
-            elif command == "tools":
-                tools = await client.list_tools()
-                for tool in tools:
-                    print(f"  {tool['name']}: {tool['description']}")
-            elif command.startswith("echo "):
-                message = command[5:]
-                result = await client.call_tool("echo", {"message": message})
-                print(f"Result: {result}")
-            elif command.startswith("calc "):
-                expression = command[5:]
-                result = await client.call_tool("calculate", {"expression": expression})
-                print(f"Result: {result}")
-            elif command == "time":
-                result = await client.call_tool("get_time", {})
-                print(f"Current time: {result}")
-            elif command == "resources":
-                resources = await client.list_resources()
-                for resource in resources:
-                    print(f"  {resource['name']}: {resource['description']}")
-            elif command == "greeting":
-                result = await client.read_resource("resource://greeting")
-                print(f"Greeting: {result}")
-            elif command == "sysinfo":
-                result = await client.read_resource("resource://system_info")
-                print(f"System info: {result}")
-            elif command == "prompts":
-                prompts = await client.list_prompts()
-                for prompt in prompts:
-                    print(f"  {prompt['name']}: {prompt['description']}")
-            else:
-                print("Unknown command. Type 'help' for available commands.")
+            
+            handler = INTERACTIVE_COMMANDS.get(command, _cmd_unknown)
+            await handler(client, arg)
                 
     except KeyboardInterrupt:
         print("\nExiting...")
@@ -340,6 +609,7 @@ async def interactive_client():
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
+    install_uvloop()
     
     if len(sys.argv) > 1 and sys.argv[1] == "interactive":
         asyncio.run(interactive_client())
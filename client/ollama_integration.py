@@ -4,31 +4,95 @@ MCP Ollama Integration Example
 This demonstrates how to integrate the MCP server with Ollama for AI interactions.
 """
 
+import aiohttp
 import asyncio
-import json
-import requests
+import re
 import sys
-from typing import Dict, List, Any
-from client import MCPClient
+from typing import Any, AsyncIterator, Dict, List, Optional
+from client import MCPClient, install_uvloop, loads
+
+# Keywords hinting that a message could benefit from a particular MCP tool
+TOOL_KEYWORDS = {
+    "calculate": ["calculate", "compute", "math", "arithmetic"],
+    "time": ["time", "date", "when", "now"],
+    "echo": ["echo", "repeat", "say back"]
+}
+
+_KEYWORD_TOOLS = {
+    keyword: tool_name
+    for tool_name, keywords in TOOL_KEYWORDS.items()
+    for keyword in keywords
+}
+
+# One alternation compiled up front; the lookahead reports overlapping matches
+# so the single scan behaves like the per-keyword substring checks it replaces
+_TOOL_KEYWORD_RE = re.compile(
+    "(?=(" + "|".join(re.escape(keyword) for keyword in _KEYWORD_TOOLS) + "))"
+)
+
+# TOOL:/PARAMS: directive lines in a model reply, extracted in a single scan
+_TOOL_CALL_RE = re.compile(r"^TOOL:(.*?)$.*?^PARAMS:(.*?)$", re.MULTILINE | re.DOTALL)
+
+_MODELS_TIMEOUT = aiohttp.ClientTimeout(total=5)
+_CHAT_TIMEOUT = aiohttp.ClientTimeout(total=30)
+
+class OllamaError(Exception):
+    """Raised when Ollama can't serve a request; the message is shown to the user"""
+
+async def _iter_ndjson(response: aiohttp.ClientResponse) -> AsyncIterator[Dict[str, Any]]:
+    """Decode a streamed newline-delimited JSON response chunk by chunk"""
+    async for line in response.content:
+        if not line.strip():
+            continue
+        chunk = loads(line)
+        yield chunk
+        if chunk.get("done"):
+            break
+
+def _chat_text(chunk: Dict[str, Any]) -> Optional[str]:
+    """Reply text from an /api/chat response or stream chunk"""
+    return chunk.get("message", {}).get("content")
+
+def _generate_text(chunk: Dict[str, Any]) -> Optional[str]:
+    """Reply text from an /api/generate response or stream chunk"""
+    return chunk.get("response")
 
 class OllamaMCPIntegration:
     def __init__(self, ollama_url: str = "http://localhost:11434"):
         self.ollama_url = ollama_url
         self.mcp_client = MCPClient()
         self.available_tools = []
+        self._tools_info = ""
         self.available_models = []
+        # Keep-alive connection pool and model list shared by every Ollama call
+        self._http: Optional[aiohttp.ClientSession] = None
+        self._models_cache: Optional[List[str]] = None
+        self.chat_model = "llama3.2:latest"
+        # Chat commands keyed by (verb, takes_argument); anything else is sent to the model
+        self._chat_commands = {
+            ("model", True): self._cmd_model,
+            ("models", False): self._cmd_models,
+            ("tools", False): self._cmd_tools,
+        }
         
-    def get_available_models(self) -> List[str]:
+    def _session(self) -> aiohttp.ClientSession:
+        """Return the shared HTTP session, creating it on first use"""
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession()
+        return self._http
+    
+    async def get_available_models(self) -> List[str]:
         """Get list of available Ollama models"""
         try:
-            response = requests.get(f"{self.ollama_url}/api/tags", timeout=5)
-            if response.status_code == 200:
-                models = response.json().get("models", [])
-                self.available_models = [model["name"] for model in models]
-                return self.available_models
-            else:
-                print(f"Error getting models: {response.status_code}")
-                return []
+            async with self._session().get(f"{self.ollama_url}/api/tags", timeout=_MODELS_TIMEOUT) as response:
+                if response.status == 200:
+                    models = (await response.json(content_type=None)).get("models", [])
+                    self.available_models = [model["name"] for model in models]
+                    self._models_cache = self.available_models
+                    return self.available_models
+                else:
+                    print(f"Error getting models: {response.status}")
+                    return []
         except Exception as e:
             print(f"Error connecting to Ollama: {e}")
             return []
@@ -47,10 +111,15 @@ class OllamaMCPIntegration:
             
         # Get available tools
         self.available_tools = await self.mcp_client.list_tools()
+        # The tool list is fixed for the session, so render its prompt section once
+        self._tools_info = "\n".join(
+            f"- {tool['name']}: {tool['description']}"
+            for tool in self.available_tools
+        )
         print(f"Connected to MCP server with tools: {[tool['name'] for tool in self.available_tools]}")
         
         # Get available Ollama models
-        self.available_models = self.get_available_models()
+        self.available_models = await self.get_available_models()
         if self.available_models:
             print(f"Available Ollama models: {self.available_models}")
         else:
@@ -58,107 +127,120 @@ class OllamaMCPIntegration:
             
         return True
     
-    def call_ollama(self, prompt: str, model: str = "llama3.2:latest") -> str:
+    async def _resolve_model(self, session: aiohttp.ClientSession, model: str) -> str:
+        """Return model, or the first available one if Ollama doesn't have it"""
+        # Only probe the model list when the cached one can't vouch for the model
+        if self._models_cache is None or model not in self._models_cache:
+            async with session.get(f"{self.ollama_url}/api/tags", timeout=_MODELS_TIMEOUT) as models_response:
+                if models_response.status != 200:
+                    raise OllamaError(f"Error: Cannot connect to Ollama at {self.ollama_url}")
+                
+                models = (await models_response.json(content_type=None)).get("models", [])
+                self._models_cache = [m["name"] for m in models]
+                self.available_models = self._models_cache
+        
+        available_models = self._models_cache
+        if not available_models:
+            raise OllamaError("Error: No models available in Ollama")
+        
+        # Use the first available model if specified model doesn't exist
+        if model not in available_models:
+            print(f"Model '{model}' not found, using '{available_models[0]}'")
+            model = available_models[0]
+        
+        return model
+    
+    async def call_ollama(self, prompt: str, model: str = "llama3.2:latest") -> str:
         """Call Ollama API"""
+        return "".join([text async for text in self._ollama_reply(prompt, model, stream=False)])
+    
+    def call_ollama_stream(self, prompt: str, model: str = "llama3.2:latest") -> AsyncIterator[str]:
+        """Call Ollama API, yielding the reply text as it is generated"""
+        return self._ollama_reply(prompt, model, stream=True)
+    
+    async def _ollama_reply(self, prompt: str, model: str, stream: bool) -> AsyncIterator[str]:
+        """Yield the reply to prompt, piece by piece if stream is set or in one go otherwise"""
+        session = self._session()
         try:
-            # First check if the model exists
-            models_response = requests.get(f"{self.ollama_url}/api/tags", timeout=5)
-            if models_response.status_code != 200:
-                return f"Error: Cannot connect to Ollama at {self.ollama_url}"
+            model = await self._resolve_model(session, model)
             
-            available_models = [m["name"] for m in models_response.json().get("models", [])]
-            if not available_models:
-                return "Error: No models available in Ollama"
-            
-            # Use the first available model if specified model doesn't exist
-            if model not in available_models:
-                model = available_models[0]
-                print(f"Model '{model}' not found, using '{available_models[0]}'")
-            
-            # Call the chat API (newer endpoint)
-            response = requests.post(
-                f"{self.ollama_url}/api/chat",
-                json={
-                    "model": model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "stream": False
-                },
-                timeout=30
+            # Call the chat API (newer endpoint), then the legacy generate endpoint as fallback
+            endpoints = (
+                ("/api/chat", {"messages": [{"role": "user", "content": prompt}]}, _chat_text),
+                ("/api/generate", {"prompt": prompt}, _generate_text),
             )
+            for path, payload, text_of in endpoints:
+                payload.update(model=model, stream=stream)
+                async with session.post(f"{self.ollama_url}{path}", json=payload, timeout=_CHAT_TIMEOUT) as response:
+                    if response.status != 200:
+                        error = f"Error calling Ollama: {response.status} - {await response.text()}"
+                        continue
+                    
+                    if stream:
+                        async for chunk in _iter_ndjson(response):
+                            text = text_of(chunk)
+                            if text:
+                                yield text
+                    else:
+                        yield text_of(await response.json(content_type=None)) or "No response from model"
+                    return
             
-            if response.status_code == 200:
-                result = response.json()
-                return result.get("message", {}).get("content", "No response from model")
-            else:
-                # Try the legacy generate endpoint as fallback
-                response = requests.post(
-                    f"{self.ollama_url}/api/generate",
-                    json={
-                        "model": model,
-                        "prompt": prompt,
-                        "stream": False
-                    },
-                    timeout=30
-                )
+            yield error
                 
-                if response.status_code == 200:
-                    return response.json().get("response", "No response from model")
-                else:
-                    return f"Error calling Ollama: {response.status_code} - {response.text}"
-                
-        except requests.exceptions.ConnectionError:
-            return "Error: Cannot connect to Ollama. Please ensure Ollama is running on localhost:11434"
-        except requests.exceptions.Timeout:
-            return "Error: Ollama request timed out"
+        except OllamaError as e:
+            yield str(e)
+        except aiohttp.ClientConnectionError:
+            yield "Error: Cannot connect to Ollama. Please ensure Ollama is running on localhost:11434"
+        except asyncio.TimeoutError:
+            yield "Error: Ollama request timed out"
         except Exception as e:
-            return f"Error calling Ollama: {str(e)}"
+            yield f"Error calling Ollama: {str(e)}"
     
     async def enhanced_chat(self, user_message: str, model: str = "llama3.2:latest") -> str:
         """Enhanced chat that can use MCP tools when needed"""
         
-        # Check if the user message might need tool assistance
-        tool_keywords = {
-            "calculate": ["calculate", "compute", "math", "arithmetic"],
-            "time": ["time", "date", "when", "now"],
-            "echo": ["echo", "repeat", "say back"]
-        }
-        
-        suggested_tools = []
-        for tool_name, keywords in tool_keywords.items():
-            if any(keyword in user_message.lower() for keyword in keywords):
-                suggested_tools.append(tool_name)
+        # Check if the user message might need tool assistance and point the model at those tools
+        suggested_tools = sorted({
+            _KEYWORD_TOOLS[match.group(1)]
+            for match in _TOOL_KEYWORD_RE.finditer(user_message.lower())
+        })
+        tool_hint = f"\nTools likely relevant to this message: {', '.join(suggested_tools)}\n" if suggested_tools else ""
         
         # Create enhanced prompt with tool information
-        tools_info = "\n".join([
-            f"- {tool['name']}: {tool['description']}" 
-            for tool in self.available_tools
-        ])
-        
         enhanced_prompt = f"""You are an AI assistant with access to the following tools through MCP (Model Context Protocol):
 
-{tools_info}
+{self._tools_info}
 
 User message: {user_message}
-
+{tool_hint}
 If the user's request could benefit from using one of these tools, please indicate which tool should be used and what parameters should be passed. Format your tool usage as:
 TOOL: tool_name
 PARAMS: {{"param1": "value1", "param2": "value2"}}
 
 Otherwise, respond normally to the user's message."""
         
-        # Get Ollama response
-        ollama_response = self.call_ollama(enhanced_prompt, model)
+        # Stream the Ollama response so a tool directive can be acted on as soon
+        # as its PARAMS line is complete, without waiting for the tokens after it
+        ollama_response = ""
+        tool_call = None
+        stream = self.call_ollama_stream(enhanced_prompt, model)
+        try:
+            async for text in stream:
+                ollama_response += text
+                if "\n" in text:
+                    tool_call = _TOOL_CALL_RE.search(ollama_response)
+                    if tool_call and tool_call.end() < len(ollama_response):
+                        break
+            else:
+                tool_call = _TOOL_CALL_RE.search(ollama_response)
+        finally:
+            await stream.aclose()
         
         # Check if Ollama suggested using a tool
-        if "TOOL:" in ollama_response and "PARAMS:" in ollama_response:
+        if tool_call:
             try:
-                lines = ollama_response.split('\n')
-                tool_line = next(line for line in lines if line.startswith("TOOL:"))
-                params_line = next(line for line in lines if line.startswith("PARAMS:"))
-                
-                tool_name = tool_line.split("TOOL:")[1].strip()
-                params_str = params_line.split("PARAMS:")[1].strip()
-                params = json.loads(params_str)
+                tool_name = tool_call.group(1).strip()
+                params = loads(tool_call.group(2).strip())
                 
                 # Execute the tool
                 tool_result = await self.mcp_client.call_tool(tool_name, params)
@@ -170,19 +252,48 @@ I used the {tool_name} tool and got this result: {tool_result}
 
 Please provide a natural response to the user incorporating this information."""
                 
-                return self.call_ollama(final_prompt, model)
+                return await self.call_ollama(final_prompt, model)
                 
             except Exception as e:
                 return f"{ollama_response}\n\n(Tool execution failed: {str(e)})"
         
         return ollama_response
     
+    async def close(self):
+        """Close the HTTP session and disconnect from the MCP server"""
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+        await self.mcp_client.disconnect()
+    
+    def _cmd_model(self, new_model: str):
+        """Switch the model used for chat"""
+        if new_model in self.available_models or not self.available_models:
+            self.chat_model = new_model
+            print(f"Switched to model: {new_model}")
+        else:
+            print(f"Model '{new_model}' not available. Available models: {self.available_models}")
+    
+    def _cmd_models(self, arg: str):
+        """List available Ollama models"""
+        if self.available_models:
+            print("Available models:", self.available_models)
+        else:
+            print("No models available or Ollama not accessible")
+    
+    def _cmd_tools(self, arg: str):
+        """List available MCP tools"""
+        print("Available MCP tools:")
+        for tool in self.available_tools:
+            print(f"  {tool['name']}: {tool['description']}")
+    
     async def interactive_chat(self, model: str = "llama3.2:latest"):
         """Interactive chat session with Ollama and MCP integration"""
         
         if not await self.initialize_mcp():
             return
-            
+        
+        self.chat_model = model
         print(f"\nEnhanced Chat with Ollama ({model}) + MCP Tools")
         print("Available MCP tools:", [tool['name'] for tool in self.available_tools])
         if self.available_models:
@@ -193,40 +304,29 @@ Please provide a natural response to the user incorporating this information."""
             while True:
                 user_input = input("You: ").strip()
                 
-                if user_input.lower() == "quit":
-                    break
-                elif user_input.lower().startswith("model "):
-                    new_model = user_input[6:].strip()
-                    if new_model in self.available_models or not self.available_models:
-                        model = new_model
-                        print(f"Switched to model: {model}")
-                    else:
-                        print(f"Model '{new_model}' not available. Available models: {self.available_models}")
-                    continue
-                elif user_input.lower() == "models":
-                    if self.available_models:
-                        print("Available models:", self.available_models)
-                    else:
-                        print("No models available or Ollama not accessible")
-                    continue
-                elif user_input.lower() == "tools":
-                    print("Available MCP tools:")
-                    for tool in self.available_tools:
-                        print(f"  {tool['name']}: {tool['description']}")
+                if not user_input:
                     continue
                 
-                if not user_input:
+                verb, _, arg = user_input.partition(" ")
+                command = (verb.lower(), bool(arg))
+                
+                if command == ("quit", False):
+                    break
+                
+                handler = self._chat_commands.get(command)
+                if handler:
+                    handler(arg.strip())
                     continue
                 
                 print("Assistant: ", end="", flush=True)
-                response = await self.enhanced_chat(user_input, model)
+                response = await self.enhanced_chat(user_input, self.chat_model)
                 print(response)
                 print()
                 
         except KeyboardInterrupt:
             print("\nGoodbye!")
         finally:
-            await self.mcp_client.disconnect()
+            await self.close()
 
 async def demo_ollama_integration():
     """Demonstrate Ollama + MCP integration"""
@@ -250,9 +350,11 @@ async def demo_ollama_integration():
         print(f"Response: {response}")
         print("-" * 50)
     
-    await integration.mcp_client.disconnect()
+    await integration.close()
 
 if __name__ == "__main__":
+    install_uvloop()
+    
     if len(sys.argv) > 1 and sys.argv[1] == "chat":
         asyncio.run(OllamaMCPIntegration().interactive_chat())
     else:
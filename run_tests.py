@@ -5,194 +5,458 @@ Run this script to validate basic functionality before CI
 """
 
 import asyncio
+import importlib
 import json
+import py_compile
 import subprocess
 import sys
 import os
-import tempfile
-import time
-from typing import Dict, Any
-
-def test_syntax_compilation():
-    """Test that all Python files compile without syntax errors"""
-    print("🔍 Testing Python syntax compilation...")
-    
-    files_to_test = [
-        "server/server.py",
-        "client/client.py", 
-        "client/ollama_integration.py",
-        "client/quick_test.py",
-        "test_server.py",
-        "start.py"
-    ]
-    
-    for file_path in files_to_test:
-        try:
-            result = subprocess.run([sys.executable, "-m", "py_compile", file_path], 
-                                  capture_output=True, text=True, check=True)
-            print(f"  ✅ {file_path} - syntax OK")
-        except subprocess.CalledProcessError as e:
-            print(f"  ❌ {file_path} - syntax error: {e.stderr}")
-            return False
-    
-    return True
-
-def test_server_functionality():
-    """Test basic MCP server functionality"""
-    print("\n🔍 Testing MCP server functionality...")
-    
+
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+SOURCE_FILES = [
+    "server/server.py",
+    "server/calc.py",
+    "client/client.py",
+    "client/ollama_integration.py",
+    "client/quick_test.py",
+    "test_server.py",
+    "start.py"
+]
+
+TOOL_NAMES = ["echo", "calculate", "get_time"]
+
+
+def start_server(*args):
+    """Start server.py with line-buffered text pipes"""
+    return subprocess.Popen(
+        [sys.executable, "server/server.py", *args],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        bufsize=1,
+        cwd=ROOT
+    )
+
+
+@pytest.fixture(scope="session")
+def mcp_server():
+    """One MCP server process shared by every test in the session"""
+    server_process = start_server()
+    yield server_process
+    server_process.terminate()
+    server_process.wait()
+
+
+@pytest.fixture(scope="session")
+def mcp_server_async():
+    """One MCP server process using the event-loop stdio transport (BlockingStdio on Windows)"""
+    server_process = start_server("--async")
+    yield server_process
+    server_process.terminate()
+    server_process.wait()
+
+
+@pytest.fixture
+def server_module():
+    """The server module, imported in process for checks below the stdio layer"""
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    return importlib.import_module("server.server")
+
+
+@pytest.fixture
+def client_module():
+    """The client module, imported in process for transport-level checks"""
+    client_dir = os.path.join(ROOT, "client")
+    if client_dir not in sys.path:
+        sys.path.insert(0, client_dir)
+    import client
+    return client
+
+
+def tool_call(request_id, tool_name, arguments, input_from=None):
+    """Build a tools/call request, optionally depending on sibling batch entries"""
+    request = {"jsonrpc": "2.0", "id": request_id, "method": "tools/call",
+               "params": {"name": tool_name, "arguments": arguments}}
+    if input_from is not None:
+        request["input_from"] = input_from
+    return request
+
+
+def rpc(server_process, method, request_id, params=None):
+    """Send one JSON-RPC request and return the parsed response"""
+    request = {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params or {}}
+    server_process.stdin.write(json.dumps(request) + "\n")
+
+    response_line = server_process.stdout.readline()
+    assert response_line, f"No response to {method}"
+
+    response = json.loads(response_line)
+    assert response.get("id") == request_id, f"Response id mismatch: {response}"
+    return response
+
+
+@pytest.mark.parametrize("file_path", SOURCE_FILES)
+def test_syntax_compilation(file_path):
+    """Test that each Python file compiles without syntax errors"""
     try:
-        # Start the server process
-        server_process = subprocess.Popen(
-            [sys.executable, "server/server.py"],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=0
+        py_compile.compile(os.path.join(ROOT, file_path), doraise=True)
+    except py_compile.PyCompileError as e:
+        pytest.fail(f"{file_path} - syntax error: {e.msg}")
+
+
+def test_server_initialization(mcp_server):
+    """Test the MCP initialize handshake"""
+    response = rpc(mcp_server, "initialize", 1, {
+        "protocolVersion": "2024-11-05",
+        "capabilities": {},
+        "clientInfo": {"name": "test-client", "version": "1.0.0"}
+    })
+    assert "result" in response, f"Initialization failed: {response}"
+
+
+def test_tools_list(mcp_server):
+    """Test that every tool is advertised"""
+    response = rpc(mcp_server, "tools/list", 2)
+    assert [tool["name"] for tool in response["result"]["tools"]] == TOOL_NAMES
+
+
+@pytest.mark.parametrize("tool_name", TOOL_NAMES)
+def test_tool_call(mcp_server, tool_name):
+    """Test that every advertised tool answers with text content"""
+    response = rpc(mcp_server, "tools/call", 3, {"name": tool_name, "arguments": {}})
+    assert "result" in response, f"Tool {tool_name} failed: {response}"
+    assert response["result"]["content"][0]["type"] == "text"
+
+
+@pytest.mark.parametrize("tool_name, arguments, expected", [
+    ("echo", {"message": "Hello, MCP!"}, "Echo: Hello, MCP!"),
+    ("calculate", {"expression": "10 + 5 * 2"}, "20"),
+    ("calculate", {"expression": "2 ** 10 % 1000"}, "24"),
+])
+def test_tool_result(mcp_server, tool_name, arguments, expected):
+    """Test tool results, including the calculator's safe evaluation"""
+    response = rpc(mcp_server, "tools/call", 4, {"name": tool_name, "arguments": arguments})
+    assert response["result"]["content"][0]["text"] == expected
+
+
+@pytest.mark.parametrize("expression", ["import os", "__import__('os')", "().__class__"])
+def test_dangerous_expression_blocked(mcp_server, expression):
+    """Test that dangerous expressions are blocked"""
+    response = rpc(mcp_server, "tools/call", 5, {"name": "calculate", "arguments": {"expression": expression}})
+    assert "result" in response, f"Calculator tool failed: {response}"
+    assert "Error calculating" in response["result"]["content"][0]["text"]
+
+
+def test_unknown_tool(mcp_server):
+    """Test that unknown tools are rejected"""
+    response = rpc(mcp_server, "tools/call", 6, {"name": "missing", "arguments": {}})
+    assert response["error"]["code"] == -32602
+
+
+def test_non_json_lines_skipped(mcp_server):
+    """Test that blank and garbage lines are dropped without a response"""
+    mcp_server.stdin.write("\n   \nnot json\n")
+    response = rpc(mcp_server, "tools/list", 9)
+    assert "result" in response
+
+
+def test_batch_requests(mcp_server):
+    """Test JSON-RPC batch request handling"""
+    batch_request = [
+        {"jsonrpc": "2.0", "id": 7, "method": "tools/call",
+         "params": {"name": "echo", "arguments": {"message": "first"}}},
+        {"jsonrpc": "2.0", "method": "notifications/initialized"},
+        {"jsonrpc": "2.0", "id": 8, "method": "tools/call",
+         "params": {"name": "calculate", "arguments": {"expression": "6 * 7"}}}
+    ]
+
+    mcp_server.stdin.write(json.dumps(batch_request) + "\n")
+
+    batch_response_line = mcp_server.stdout.readline()
+    assert batch_response_line, "No batch response"
+
+    batch_response = json.loads(batch_response_line)
+    assert isinstance(batch_response, list), f"Batch response has wrong shape: {batch_response}"
+    assert [r.get("id") for r in batch_response] == [7, 8]
+
+    results = [r["result"]["content"][0]["text"] for r in batch_response]
+    assert results == ["Echo: first", "42"]
+
+
+def test_batch_input_from(mcp_server):
+    """Test that input_from batches answer in request order and reject unresolved dependencies"""
+    batch_request = [
+        {"jsonrpc": "2.0", "id": 10, "method": "tools/call", "input_from": 11,
+         "params": {"name": "echo", "arguments": {"message": "after"}}},
+        {"jsonrpc": "2.0", "id": 11, "method": "tools/call",
+         "params": {"name": "echo", "arguments": {"message": "before"}}},
+        {"jsonrpc": "2.0", "id": 12, "method": "tools/list", "input_from": [12]}
+    ]
+
+    mcp_server.stdin.write(json.dumps(batch_request) + "\n")
+
+    batch_response = json.loads(mcp_server.stdout.readline())
+    assert [r.get("id") for r in batch_response] == [10, 11, 12]
+    assert batch_response[0]["result"]["content"][0]["text"] == "Echo: after"
+    assert batch_response[2]["error"]["code"] == -32600
+
+
+@pytest.mark.parametrize("requests, expected", [
+    ([{"id": 1}, {"id": 2}], ([[0, 1]], [])),
+    ([{"id": 10, "input_from": 11}, {"id": 11}, {"id": 12, "input_from": [12]}], ([[1], [0]], [2])),
+    ([{"id": "a"}, {"id": "b", "input_from": "a"}, {"id": "c", "input_from": ["a", "b"]}], ([[0], [1], [2]], [])),
+    ([{"id": 1, "input_from": 2}, {"id": 2, "input_from": 1}], ([], [0, 1])),
+    ([{"id": 1, "input_from": 99}, 5, {"id": 2, "input_from": [{"x": 1}]}], ([[1]], [0, 2])),
+])
+def test_batch_layers(server_module, requests, expected):
+    """Test that batch entries are layered after the siblings named by input_from"""
+    assert server_module.batch_layers(requests) == expected
+
+
+def test_async_tool_keeps_its_loop(server_module):
+    """Test that the blocking server runs every async tool call on the same live loop"""
+    server = server_module.MCPServer()
+    loops = []
+
+    async def remember_loop(arguments):
+        loops.append(asyncio.get_running_loop())
+        await asyncio.sleep(0)
+        return "ok"
+
+    server._tool_handlers["remember_loop"] = remember_loop
+    line = json.dumps(tool_call(1, "remember_loop", {})).encode()
+    for _ in range(2):
+        response = json.loads(server.run_pending(server_module.process_line(server, line)))
+        assert response["result"]["content"][0]["text"] == "ok"
+
+    assert loops[0] is loops[1] and not loops[0].is_closed()
+    server.close()
+
+
+def test_async_batch_layers_run_concurrently(server_module):
+    """Test that a layer's async tools overlap and dependents wait for the whole layer"""
+    server = server_module.MCPServer()
+    events = []
+
+    async def step(arguments):
+        events.append(("start", arguments["name"]))
+        await asyncio.sleep(0.01)
+        events.append(("end", arguments["name"]))
+        return arguments["name"]
+
+    server._tool_handlers["step"] = step
+    batch = [
+        tool_call(1, "step", {"name": "a"}),
+        tool_call(2, "step", {"name": "b"}),
+        tool_call(3, "step", {"name": "c"}, input_from=[1, 2]),
+    ]
+    line = json.dumps(batch).encode()
+    responses = json.loads(server.run_pending(server_module.process_line(server, line)))
+    server.close()
+
+    assert [r["result"]["content"][0]["text"] for r in responses] == ["a", "b", "c"]
+    assert events[:2] == [("start", "a"), ("start", "b")]
+    assert events[4:] == [("start", "c"), ("end", "c")]
+
+
+def test_async_server_round_trip(mcp_server_async):
+    """Test single and batched requests through server.py --async"""
+    response = rpc(mcp_server_async, "tools/call", 1, {"name": "calculate", "arguments": {"expression": "6 * 7"}})
+    assert response["result"]["content"][0]["text"] == "42"
+
+    batch_request = [
+        tool_call(2, "echo", {"message": "after"}, input_from=3),
+        tool_call(3, "echo", {"message": "before"}),
+        {"jsonrpc": "2.0", "method": "notifications/initialized"},
+        tool_call(4, "echo", {"message": "never"}, input_from=99),
+    ]
+    mcp_server_async.stdin.write("not json\n" + json.dumps(batch_request) + "\n")
+
+    batch_response = json.loads(mcp_server_async.stdout.readline())
+    assert [r.get("id") for r in batch_response] == [2, 3, 4]
+    assert [r["result"]["content"][0]["text"] for r in batch_response[:2]] == ["Echo: after", "Echo: before"]
+    assert batch_response[2]["error"]["code"] == -32600
+
+
+def test_open_stdio_blocking_on_windows(server_module, monkeypatch):
+    """Test that Windows skips the proactor pipe transports, so --async works in the Windows job"""
+    monkeypatch.setattr(server_module.sys, "platform", "win32")
+    reader, writer = asyncio.run(server_module.open_stdio())
+    assert isinstance(reader, server_module.BlockingStdio)
+    assert writer is reader
+
+
+@pytest.mark.parametrize("stdin_file, stdout_file", [(False, True), (True, False), (True, True)])
+def test_async_server_redirected_stdio(tmp_path, stdin_file, stdout_file):
+    """Test that --async answers every request when stdin or stdout is a regular file"""
+    requests = "".join(json.dumps({"jsonrpc": "2.0", "id": i, "method": "tools/list"}) + "\n" for i in range(50))
+    in_path = tmp_path / "requests.jsonl"
+    out_path = tmp_path / "responses.jsonl"
+    in_path.write_text(requests)
+
+    with open(in_path, "rb") as stdin, open(out_path, "wb") as stdout:
+        result = subprocess.run(
+            [sys.executable, "server/server.py", "--async"],
+            stdin=stdin if stdin_file else None,
+            input=None if stdin_file else requests.encode(),
+            stdout=stdout if stdout_file else subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=ROOT,
+            timeout=30
         )
-        
-        # Test initialization
-        init_request = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "initialize",
-            "params": {
-                "protocolVersion": "2024-11-05",
-                "capabilities": {},
-                "clientInfo": {"name": "test-client", "version": "1.0.0"}
-            }
-        }
-        
-        server_process.stdin.write(json.dumps(init_request) + "\n")
-        server_process.stdin.flush()
-        
-        response_line = server_process.stdout.readline()
-        if not response_line:
-            print("  ❌ No initialization response")
-            return False
-            
-        response = json.loads(response_line.strip())
-        if "result" not in response:
-            print(f"  ❌ Initialization failed: {response}")
-            return False
-            
-        print("  ✅ Server initialization - OK")
-        
-        # Test calculator tool with safe evaluation
-        calc_request = {
-            "jsonrpc": "2.0",
-            "id": 2,
-            "method": "tools/call",
-            "params": {
-                "name": "calculate",
-                "arguments": {"expression": "10 + 5 * 2"}
-            }
-        }
-        
-        server_process.stdin.write(json.dumps(calc_request) + "\n")
-        server_process.stdin.flush()
-        
-        calc_response_line = server_process.stdout.readline()
-        if calc_response_line:
-            calc_response = json.loads(calc_response_line.strip())
-            if "result" in calc_response:
-                result_text = calc_response["result"]["content"][0]["text"]
-                if result_text == "20":
-                    print("  ✅ Calculator tool - OK")
-                else:
-                    print(f"  ❌ Calculator tool returned wrong result: {result_text}")
-                    return False
-            else:
-                print(f"  ❌ Calculator tool failed: {calc_response}")
-                return False
-        else:
-            print("  ❌ No calculator response")
-            return False
-            
-        # Test that dangerous expressions are blocked
-        dangerous_request = {
-            "jsonrpc": "2.0",
-            "id": 3,
-            "method": "tools/call",
-            "params": {
-                "name": "calculate",
-                "arguments": {"expression": "import os"}
-            }
-        }
-        
-        server_process.stdin.write(json.dumps(dangerous_request) + "\n")
-        server_process.stdin.flush()
-        
-        dangerous_response_line = server_process.stdout.readline()
-        if dangerous_response_line:
-            dangerous_response = json.loads(dangerous_response_line.strip())
-            if "result" in dangerous_response:
-                result_text = dangerous_response["result"]["content"][0]["text"]
-                if "Error calculating" in result_text:
-                    print("  ✅ Security - dangerous expressions blocked")
-                else:
-                    print(f"  ❌ Security - dangerous expression not blocked: {result_text}")
-                    return False
-            else:
-                print("  ❌ No response to dangerous expression test")
-                return False
-        
-        server_process.terminate()
-        server_process.wait()
-        print("  ✅ Server functionality - OK")
-        return True
-        
-    except Exception as e:
-        print(f"  ❌ Server test failed: {e}")
-        return False
+
+    output = out_path.read_bytes() if stdout_file else result.stdout
+    assert [json.loads(line)["id"] for line in output.splitlines()] == list(range(50))
+
+
+@pytest.mark.parametrize("arguments", [
+    {"value": -0.0}, {"value": 1.5}, {"value": (1, 2)}, {"value": [1]}, {"value": {"a": 1}}, {1: "x"},
+])
+def test_tool_call_key_uncacheable(client_module, arguments):
+    """Test that arguments whose equal values can encode differently bypass the template cache"""
+    assert client_module.tool_call_key(arguments) is None
+
+
+def test_tool_call_key_exact(client_module):
+    """Test that cached tool call templates never reuse another argument set's encoding"""
+    key = client_module.tool_call_key
+    template = client_module.tool_call_template
+    assert key({"b": "x", "a": None}) == key({"a": None, "b": "x"})
+    assert key({"value": 1}) != key({"value": True})
+    assert template("echo", key({"value": 1})) != template("echo", key({"value": True}))
+    assert b'"value":true' in template("echo", key({"value": True}))
+
+
+@pytest.mark.parametrize("chunks", [
+    [b'{"id": 1}\n{"id": 2}\n{"id": 3}\n'],
+    [b'{"id"', b': 1}\n{"id": 2', b'}\n', b'\n{"id": 3}', b'\n'],
+    [bytes([byte]) for byte in b'{"id": 1}\n \n{"id": 2}\n{"id": 3}\n'],
+])
+def test_client_framing(client_module, chunks):
+    """Test that responses are framed whole however the server's output is split into reads"""
+    lines = []
+
+    async def feed():
+        protocol = client_module.MCPClientProtocol(lambda line: lines.append(bytes(line)), lambda: None)
+        for chunk in chunks:
+            protocol.pipe_data_received(1, chunk)
+        protocol.pipe_data_received(2, b'{"id": 4}\n')
+        return protocol._buffer
+
+    assert not asyncio.run(feed())
+    assert [json.loads(line)["id"] for line in lines] == [1, 2, 3]
+
+
+def test_client_concurrent_tool_calls(client_module):
+    """Test that concurrent tool calls over one connection each get their own result"""
+    async def call_all():
+        client = client_module.MCPClient()
+        assert await client.connect_to_server([sys.executable, os.path.join(ROOT, "server", "server.py")])
+        try:
+            assert await client.initialize()
+            return await asyncio.gather(*(
+                client.call_tool("calculate", {"expression": f"{i} * 3"}) for i in range(50)
+            ), client.call_tool("echo", {"message": "hi"}))
+        finally:
+            await client.disconnect()
+
+    results = asyncio.run(call_all())
+    assert all(str(i * 3) in result for i, result in enumerate(results[:-1]))
+    assert "hi" in results[-1]
+
+
+def test_client_skips_non_object_responses(client_module):
+    """Test that valid JSON lines which aren't objects are dropped without stalling framing"""
+    async def feed():
+        client = client_module.MCPClient()
+        waiter = asyncio.get_running_loop().create_future()
+        client._pending[1] = waiter
+        protocol = client_module.MCPClientProtocol(client._dispatch_response, client._connection_lost)
+        protocol.pipe_data_received(1, b'[1, 2]\n"text"\n{"id": [1]}\n{"jsonrpc": "2.0", "id": 1, "result": {}}\n')
+        assert not protocol._buffer
+        return await asyncio.wait_for(waiter, 1)
+
+    assert asyncio.run(feed())["id"] == 1
+
+
+def test_server_package_import():
+    """Test that the server imports as server.server from the repo root, calc included"""
+    result = subprocess.run([sys.executable, "-c", "import server.server"],
+                            cwd=ROOT, capture_output=True, text=True, timeout=30)
+    assert result.returncode == 0, result.stderr
+
+
+@pytest.mark.parametrize("reply, expected", [
+    ("TOOL: calculate\nPARAMS: {\"expression\": \"2 + 3\"}", ("calculate", '{"expression": "2 + 3"}')),
+    ("Sure.\nTOOL: echo\nnote\nPARAMS: {}\nmore", ("echo", "{}")),
+    ("TOOL: echo\n", None),
+    ("No tools needed.\n", None),
+])
+def test_tool_call_re(client_module, reply, expected):
+    """Test that TOOL:/PARAMS: directives are pulled out of a model reply"""
+    from ollama_integration import _TOOL_CALL_RE
+    match = _TOOL_CALL_RE.search(reply)
+    assert (match and tuple(group.strip() for group in match.groups())) == expected
+
+
+def test_enhanced_chat_stops_streaming_at_tool_call(client_module):
+    """Test that enhanced_chat acts on a tool directive once its PARAMS line is complete"""
+    from ollama_integration import OllamaMCPIntegration
+    chunks = ["Let me work that out.\n", "TOOL: calculate\n", 'PARAMS: {"expression": ', '"6 * 7"}', "\n",
+              "Anything after this", " is never read\n"]
+    consumed, calls, prompts = [], [], []
+
+    async def stream(prompt, model):
+        prompts.append(prompt)
+        for chunk in chunks:
+            consumed.append(chunk)
+            yield chunk
+
+    async def call_tool(name, arguments):
+        calls.append((name, arguments))
+        return "42"
+
+    async def call_ollama(prompt, model):
+        prompts.append(prompt)
+        return "It's 42."
+
+    integration = OllamaMCPIntegration()
+    integration.call_ollama_stream = stream
+    integration.call_ollama = call_ollama
+    integration.mcp_client.call_tool = call_tool
+
+    assert asyncio.run(integration.enhanced_chat("Calculate 6 * 7")) == "It's 42."
+    assert consumed == chunks[:5]
+    assert calls == [("calculate", {"expression": "6 * 7"})]
+    assert "Tools likely relevant to this message: calculate\n" in prompts[0]
+    assert "42" in prompts[1]
+
 
 def test_client_imports():
     """Test that client modules can be imported"""
-    print("\n🔍 Testing client imports...")
-    
-    try:
-        # Test client import
-        sys.path.append("client")
-        from client import MCPClient
-        print("  ✅ MCPClient import - OK")
-        
-        # Test ollama integration import
-        from ollama_integration import OllamaMCPIntegration
-        print("  ✅ OllamaMCPIntegration import - OK")
-        
-        return True
-        
-    except Exception as e:
-        print(f"  ❌ Import test failed: {e}")
-        return False
+    sys.path.append(os.path.join(ROOT, "client"))
+    from client import MCPClient  # noqa: F401
+    from ollama_integration import OllamaMCPIntegration  # noqa: F401
+
 
 def main():
     """Run all tests"""
     print("🧪 Running MCP Tutorial Tests")
     print("=" * 50)
-    
-    all_passed = True
-    
-    # Test syntax compilation
-    if not test_syntax_compilation():
-        all_passed = False
-    
-    # Test server functionality
-    if not test_server_functionality():
-        all_passed = False
-    
-    # Test client imports
-    if not test_client_imports():
-        all_passed = False
-    
+
+    exit_code = pytest.main(["-v", "-p", "no:cacheprovider", os.path.abspath(__file__)])
+
     print("\n" + "=" * 50)
-    if all_passed:
+    if exit_code == 0:
         print("🎉 All tests passed! Ready for CI.")
-        sys.exit(0)
     else:
         print("❌ Some tests failed. Please fix issues before CI.")
-        sys.exit(1)
+    sys.exit(exit_code)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Safe calculator used by the MCP tutorial server's calculate tool.
+Expressions are limited to numbers and arithmetic by an AST whitelist. The module
+is fully annotated so it can be compiled with mypyc (`cd server && mypyc calc.py`);
+Python imports the compiled extension in place of this file whenever it is present.
+"""
+
+import ast
+import functools
+from types import CodeType
+from typing import Union
+
+Number = Union[int, float, complex]
+
+# AST nodes a calculator expression may contain: numbers and arithmetic only
+CALCULATOR_NODES = (
+    ast.Expression, ast.Constant, ast.BinOp, ast.UnaryOp,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod, ast.Pow, ast.BitXor,
+    ast.USub, ast.UAdd,
+)
+
+@functools.lru_cache(maxsize=1024)
+def compile_expression(expression: str) -> CodeType:
+    """Parse, whitelist-check and compile a calculator expression (cached per expression)"""
+    tree = ast.parse(expression, mode="eval")
+    for node in ast.walk(tree):
+        if not isinstance(node, CALCULATOR_NODES):
+            raise TypeError(f"Unsupported operation: {type(node).__name__}")
+        if isinstance(node, ast.Constant) and type(node.value) not in (int, float, complex):
+            raise TypeError(f"Unsupported constant: {node.value!r}")
+    return compile(tree, "<calculate>", "eval")
+
+def evaluate(expression: str) -> Number:
+    """Evaluate a whitelisted arithmetic expression"""
+    result: Number = eval(compile_expression(expression), {"__builtins__": {}}, {})
+    return result
@@ -6,24 +6,125 @@ This server provides basic tools and resources for demonstration purposes.
 
 import asyncio
 import json
+import platform
+import select
 import sys
-from typing import Any, Dict, List, Optional
+import time
+from types import MappingProxyType
+from typing import Any, Awaitable, Dict, Iterator, List, Optional, Tuple
 import logging
 
+# Imported as a script from server/ or as the server.server module from the repo root
+try:
+    from calc import evaluate
+except ImportError:
+    from .calc import evaluate
+
+# Prefer orjson for request parsing and response encoding; fall back to the stdlib
+try:
+    import orjson
+
+    dumps = orjson.dumps
+    loads = orjson.loads
+except ImportError:
+    def dumps(obj: Any) -> bytes:
+        """Serialize obj to compact JSON bytes"""
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    loads = json.loads
+
+# Shared read-only default for absent params/arguments, so requests that omit
+# them don't allocate a fresh dict each time
+NO_PARAMS = MappingProxyType({})
+
+def encode_result(result: Dict[str, Any]) -> bytes:
+    """Serialize the tail of a success response, everything after its id"""
+    return b',"result":' + dumps(result) + b"}"
+
+def encode_cached_response(request_id: Any, body: bytes) -> bytes:
+    """Splice a request id into a body built by encode_result()"""
+    if type(request_id) is int:
+        encoded_id = b"%d" % request_id
+    else:
+        encoded_id = dumps(request_id)
+    return b'{"jsonrpc":"2.0","id":' + encoded_id + body
+
+def error_template(code: int, message: str) -> bytes:
+    """Build the tail of an error response; %s in message takes JSON-escaped detail"""
+    return b',"error":{"code":%d,"message":"' % code + message.encode() + b'"}}'
+
+METHOD_NOT_FOUND_ERROR = error_template(-32601, "Method not found: %s")
+INVALID_REQUEST_ERROR = error_template(-32600, "Invalid Request")
+EMPTY_BATCH_ERROR = error_template(-32600, "Invalid Request: empty batch")
+UNKNOWN_TOOL_ERROR = error_template(-32602, "Unknown tool: %s")
+UNKNOWN_RESOURCE_ERROR = error_template(-32602, "Unknown resource: %s")
+UNKNOWN_PROMPT_ERROR = error_template(-32602, "Unknown prompt: %s")
+INTERNAL_ERROR = error_template(-32603, "Internal error: %s")
+UNRESOLVED_INPUT_ERROR = error_template(-32600, "Invalid Request: unresolved input_from %s")
+
+def encode_error(request_id: Any, template: bytes, detail: Any) -> bytes:
+    """Fill an error_template() with a request id and JSON-escaped detail text"""
+    # Slicing the quotes off a JSON string leaves it safe to splice into another
+    return encode_cached_response(request_id, template % dumps(str(detail))[1:-1])
+
+def batch_layers(requests: List[Any]) -> Tuple[List[List[int]], List[int]]:
+    """Group batch entries into layers that only depend on earlier layers.
+    
+    An entry may name the id (or list of ids) of sibling requests it must run
+    after in an "input_from" member. Returns the layers as lists of entry
+    indexes, plus the indexes whose dependencies are unknown or circular.
+    """
+    waiting = {}
+    for index, request in enumerate(requests):
+        wanted = request.get("input_from") if isinstance(request, dict) else None
+        if wanted is not None:
+            waiting[index] = wanted if isinstance(wanted, list) else [wanted]
+    if not waiting:
+        return [list(range(len(requests)))], []
+    
+    indexes = {
+        request["id"]: index
+        for index, request in enumerate(requests)
+        if isinstance(request, dict) and type(request.get("id")) in (int, str)
+    }
+    for index, wanted in waiting.items():
+        waiting[index] = {indexes.get(dep) if type(dep) in (int, str) else None for dep in wanted}
+    
+    layers = []
+    done = set()
+    layer = [index for index in range(len(requests)) if index not in waiting]
+    while layer:
+        layers.append(layer)
+        done.update(layer)
+        layer = [index for index, deps in waiting.items() if index not in done and deps <= done]
+    return layers, [index for index in waiting if index not in done]
+
+def encode_message(message: Any) -> bytes:
+    """Serialize a response, a batch of responses, or pass through a pre-encoded one"""
+    if isinstance(message, bytes):
+        return message
+    if isinstance(message, list):
+        return b"[" + b",".join(encode_message(item) for item in message) + b"]"
+    return dumps(message)
+
 # MCP Server implementation
 class MCPServer:
     def __init__(self):
-        self.tools = {}
-        self.resources = {}
-        self.prompts = {}
+        # (second, formatted time) for get_time, which only changes once a second
+        self._time_cache = (-1, "")
+        # Event loop the blocking server runs async tools on, created on first use
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
         self.setup_tools()
         self.setup_resources()
         self.setup_prompts()
+        self.setup_response_cache()
+        self.setup_handlers()
         
     def setup_tools(self):
         """Setup available tools for the MCP server"""
-        self.tools = {
-            "echo": {
+        # Schemas are only ever rendered by tools/list, so keep just their encoded form
+        tool_schemas = [
+            {
                 "name": "echo",
                 "description": "Echo back the input message",
                 "inputSchema": {
@@ -37,7 +138,7 @@ class MCPServer:
                     "required": ["message"]
                 }
             },
-            "calculate": {
+            {
                 "name": "calculate",
                 "description": "Perform basic mathematical calculations",
                 "inputSchema": {
@@ -51,7 +152,7 @@ class MCPServer:
                     "required": ["expression"]
                 }
             },
-            "get_time": {
+            {
                 "name": "get_time",
                 "description": "Get current date and time",
                 "inputSchema": {
@@ -60,29 +161,54 @@ class MCPServer:
                     "required": []
                 }
             }
-        }
+        ]
+        self._tools_list_body = encode_result({"tools": tool_schemas})
     
     def setup_resources(self):
         """Setup available resources for the MCP server"""
-        self.resources = {
-            "greeting": {
+        resources = [
+            {
                 "uri": "resource://greeting",
                 "name": "Greeting Message",
                 "description": "A simple greeting message",
                 "mimeType": "text/plain"
             },
-            "system_info": {
-                "uri": "resource://system_info", 
+            {
+                "uri": "resource://system_info",
                 "name": "System Information",
                 "description": "Basic system information",
                 "mimeType": "application/json"
             }
+        ]
+        self._resources_list_body = encode_result({"resources": resources})
+        
+        # Resource contents (platform details included) can't change while the
+        # process runs, so every resources/read result is serialized once by uri
+        contents = {
+            "resource://greeting": "Hello! Welcome to the MCP Tutorial Server!",
+            "resource://system_info": json.dumps({
+                "platform": platform.system(),
+                "python_version": platform.python_version(),
+                "architecture": platform.architecture()[0]
+            })
+        }
+        self._resource_bodies = {
+            resource["uri"]: encode_result({
+                "contents": [
+                    {
+                        "uri": resource["uri"],
+                        "mimeType": resource["mimeType"],
+                        "text": contents[resource["uri"]]
+                    }
+                ]
+            })
+            for resource in resources
         }
     
     def setup_prompts(self):
         """Setup available prompts for the MCP server"""
-        self.prompts = {
-            "helpful_assistant": {
+        prompts = [
+            {
                 "name": "helpful_assistant",
                 "description": "A helpful assistant prompt",
                 "arguments": [
@@ -93,136 +219,161 @@ class MCPServer:
                     }
                 ]
             }
+        ]
+        self._prompts_list_body = encode_result({"prompts": prompts})
+    
+    def setup_response_cache(self):
+        """Pre-serialize the responses that only differ by request id"""
+        self._initialize_body = encode_result({
+            "protocolVersion": "2024-11-05",
+            "capabilities": {
+                "tools": {},
+                "resources": {},
+                "prompts": {}
+            },
+            "serverInfo": {
+                "name": "tutorial-mcp-server",
+                "version": "1.0.0"
+            }
+        })
+    
+    def setup_handlers(self):
+        """Map JSON-RPC methods, tool names and prompt names to their implementations"""
+        self._method_handlers = {
+            "initialize": self.handle_initialize,
+            "tools/list": self.handle_tools_list,
+            "tools/call": self.handle_tool_call,
+            "resources/list": self.handle_resources_list,
+            "resources/read": self.handle_resource_read,
+            "prompts/list": self.handle_prompts_list,
+            "prompts/get": self.handle_prompt_get,
+        }
+        self._tool_handlers = {
+            "echo": self.tool_echo,
+            "calculate": self.tool_calculate,
+            "get_time": self.tool_get_time,
+        }
+        self._prompt_handlers = {
+            "helpful_assistant": self.prompt_helpful_assistant,
         }
     
-    async def handle_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+    def handle_request(self, request: Dict[str, Any]) -> Any:
         """Handle incoming MCP requests"""
         method = request.get("method")
-        params = request.get("params", {})
+        params = request.get("params", NO_PARAMS)
         request_id = request.get("id")
         
+        handler = self._method_handlers.get(method) if isinstance(method, str) else None
+        if handler is None:
+            return encode_error(request_id, METHOD_NOT_FOUND_ERROR, method)
+        
         try:
-            if method == "initialize":
-                return await self.handle_initialize(request_id, params)
-            elif method == "tools/list":
-                return await self.handle_tools_list(request_id)
-            elif method == "tools/call":
-                return await self.handle_tool_call(request_id, params)
-            elif method == "resources/list":
-                return await self.handle_resources_list(request_id)
-            elif method == "resources/read":
-                return await self.handle_resource_read(request_id, params)
-            elif method == "prompts/list":
-                return await self.handle_prompts_list(request_id)
-            elif method == "prompts/get":
-                return await self.handle_prompt_get(request_id, params)
-            else:
-                return {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "error": {
-                        "code": -32601,
-                        "message": f"Method not found: {method}"
-                    }
-                }
+            return handler(request_id, params)
         except Exception as e:
-            return {
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "error": {
-                    "code": -32603,
-                    "message": f"Internal error: {str(e)}"
-                }
-            }
+            return encode_error(request_id, INTERNAL_ERROR, e)
+    
+    def run_pending(self, response: Any) -> Any:
+        """Run an async tool's response to completion from the blocking server"""
+        if not asyncio.iscoroutine(response):
+            return response
+        # One loop for the server's lifetime, so loop-bound tool state such as
+        # HTTP sessions stays usable from one call to the next
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(response)
+    
+    def close(self):
+        """Release the blocking server's event loop"""
+        if self._loop is not None:
+            self._loop.close()
+            self._loop = None
+    
+    def handle_entry(self, request: Any) -> Any:
+        """Handle one batch entry, which may not be a request object at all"""
+        return self.handle_request(request) if isinstance(request, dict) else self.handle_invalid_request()
     
-    async def handle_initialize(self, request_id: int, params: Dict[str, Any]) -> Dict[str, Any]:
+    def handle_batch(self, requests: List[Any]) -> Optional[Any]:
+        """Handle a JSON-RPC batch, returning responses in request order.
+        
+        If an async tool is hit, a coroutine finishing the batch is returned instead.
+        """
+        if not requests:
+            return encode_cached_response(None, EMPTY_BATCH_ERROR)
+        
+        layers, unresolved = batch_layers(requests)
+        responses: List[Any] = [None] * len(requests)
+        for index in unresolved:
+            request = requests[index]
+            responses[index] = encode_error(request.get("id"), UNRESOLVED_INPUT_ERROR, dumps(request["input_from"]).decode())
+        
+        for position, layer in enumerate(layers):
+            for index in layer:
+                responses[index] = self.handle_entry(requests[index])
+            if any(asyncio.iscoroutine(responses[index]) for index in layer):
+                return self.finish_batch(requests, responses, layers[position:])
+        
+        return self.batch_replies(requests, responses)
+    
+    async def finish_batch(self, requests: List[Any], responses: List[Any], layers: List[List[int]]) -> Optional[Any]:
+        """Finish a batch from a started layer on, running each layer's async tools concurrently"""
+        for position, layer in enumerate(layers):
+            if position:
+                for index in layer:
+                    responses[index] = self.handle_entry(requests[index])
+            
+            waiting = [index for index in layer if asyncio.iscoroutine(responses[index])]
+            results = await asyncio.gather(*[responses[index] for index in waiting])
+            for index, response in zip(waiting, results):
+                responses[index] = response
+        
+        return self.batch_replies(requests, responses)
+    
+    def batch_replies(self, requests: List[Any], responses: List[Any]) -> Optional[List[Any]]:
+        """Drop notification responses from a batch, or return None if nothing is left"""
+        # Notifications (requests without an id) must not be answered
+        responses = [
+            response
+            for request, response in zip(requests, responses)
+            if not isinstance(request, dict) or "id" in request
+        ]
+        return responses or None
+    
+    def handle_invalid_request(self) -> bytes:
+        """Handle a batch entry that is not a request object"""
+        return encode_cached_response(None, INVALID_REQUEST_ERROR)
+    
+    def handle_initialize(self, request_id: int, params: Dict[str, Any]) -> bytes:
         """Handle initialization request"""
-        return {
-            "jsonrpc": "2.0",
-            "id": request_id,
-            "result": {
-                "protocolVersion": "2024-11-05",
-                "capabilities": {
-                    "tools": {},
-                    "resources": {},
-                    "prompts": {}
-                },
-                "serverInfo": {
-                    "name": "tutorial-mcp-server",
-                    "version": "1.0.0"
-                }
-            }
-        }
+        return encode_cached_response(request_id, self._initialize_body)
     
-    async def handle_tools_list(self, request_id: int) -> Dict[str, Any]:
+    def handle_tools_list(self, request_id: int, params: Dict[str, Any]) -> bytes:
         """Handle tools list request"""
-        return {
-            "jsonrpc": "2.0",
-            "id": request_id,
-            "result": {
-                "tools": list(self.tools.values())
-            }
-        }
+        return encode_cached_response(request_id, self._tools_list_body)
     
-    async def handle_tool_call(self, request_id: int, params: Dict[str, Any]) -> Dict[str, Any]:
+    def handle_tool_call(self, request_id: int, params: Dict[str, Any]) -> Any:
         """Handle tool call request"""
         tool_name = params.get("name")
-        arguments = params.get("arguments", {})
+        arguments = params.get("arguments", NO_PARAMS)
         
-        if tool_name == "echo":
-            message = arguments.get("message", "")
-            result = f"Echo: {message}"
-        elif tool_name == "calculate":
-            expression = arguments.get("expression", "")
-            try:
-                # Safe evaluation - only allow basic math operations
-                import ast
-                import operator
-                
-                # Allowed operations for safe math evaluation
-                ops = {
-                    ast.Add: operator.add,
-                    ast.Sub: operator.sub,
-                    ast.Mult: operator.mul,
-                    ast.Div: operator.truediv,
-                    ast.Pow: operator.pow,
-                    ast.BitXor: operator.xor,
-                    ast.USub: operator.neg,
-                }
-                
-                def eval_expr(expr):
-                    """Safely evaluate mathematical expressions"""
-                    return eval_(ast.parse(expr, mode='eval').body)
-                
-                def eval_(node):
-                    """Recursive evaluation of AST nodes"""
-                    if isinstance(node, ast.Num):  # number
-                        return node.n
-                    elif isinstance(node, ast.Constant):  # Python 3.8+
-                        return node.value
-                    elif isinstance(node, ast.BinOp):  # binary operation
-                        return ops[type(node.op)](eval_(node.left), eval_(node.right))
-                    elif isinstance(node, ast.UnaryOp):  # unary operation
-                        return ops[type(node.op)](eval_(node.operand))
-                    else:
-                        raise TypeError(f"Unsupported operation: {type(node)}")
-                
-                result = str(eval_expr(expression))
-            except Exception as e:
-                result = f"Error calculating: {str(e)}"
-        elif tool_name == "get_time":
-            import datetime
-            result = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        else:
-            return {
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "error": {
-                    "code": -32602,
-                    "message": f"Unknown tool: {tool_name}"
-                }
-            }
+        tool = self._tool_handlers.get(tool_name)
+        if tool is None:
+            return encode_error(request_id, UNKNOWN_TOOL_ERROR, tool_name)
+        
+        result = tool(arguments)
+        if asyncio.iscoroutine(result):
+            return self.finish_tool_call(request_id, result)
         
+        return self.tool_response(request_id, result)
+    
+    async def finish_tool_call(self, request_id: int, result: Awaitable[str]) -> Any:
+        """Await an async tool and build its response"""
+        try:
+            return self.tool_response(request_id, await result)
+        except Exception as e:
+            return encode_error(request_id, INTERNAL_ERROR, e)
+    
+    def tool_response(self, request_id: int, result: str) -> Dict[str, Any]:
+        """Wrap a tool's text result in a tools/call response"""
         return {
             "jsonrpc": "2.0",
             "id": request_id,
@@ -236,140 +387,268 @@ class MCPServer:
             }
         }
     
-    async def handle_resources_list(self, request_id: int) -> Dict[str, Any]:
+    def tool_echo(self, arguments: Dict[str, Any]) -> str:
+        """Echo back the input message"""
+        message = arguments.get("message", "")
+        return f"Echo: {message}"
+    
+    def tool_calculate(self, arguments: Dict[str, Any]) -> str:
+        """Evaluate a whitelisted arithmetic expression"""
+        expression = arguments.get("expression", "")
+        try:
+            return str(evaluate(expression))
+        except Exception as e:
+            return f"Error calculating: {str(e)}"
+    
+    def tool_get_time(self, arguments: Dict[str, Any]) -> str:
+        """Get current date and time"""
+        second = int(time.time())
+        if second != self._time_cache[0]:
+            self._time_cache = (second, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second)))
+        return self._time_cache[1]
+    
+    def handle_resources_list(self, request_id: int, params: Dict[str, Any]) -> bytes:
         """Handle resources list request"""
-        return {
-            "jsonrpc": "2.0",
-            "id": request_id,
-            "result": {
-                "resources": list(self.resources.values())
-            }
-        }
+        return encode_cached_response(request_id, self._resources_list_body)
     
-    async def handle_resource_read(self, request_id: int, params: Dict[str, Any]) -> Dict[str, Any]:
+    def handle_resource_read(self, request_id: int, params: Dict[str, Any]) -> Any:
         """Handle resource read request"""
         uri = params.get("uri", "")
         
-        if uri == "resource://greeting":
-            content = "Hello! Welcome to the MCP Tutorial Server!"
-        elif uri == "resource://system_info":
-            import platform
-            content = json.dumps({
-                "platform": platform.system(),
-                "python_version": platform.python_version(),
-                "architecture": platform.architecture()[0]
-            })
-        else:
-            return {
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "error": {
-                    "code": -32602,
-                    "message": f"Unknown resource: {uri}"
-                }
-            }
+        body = self._resource_bodies.get(uri)
+        if body is None:
+            return encode_error(request_id, UNKNOWN_RESOURCE_ERROR, uri)
         
-        return {
-            "jsonrpc": "2.0",
-            "id": request_id,
-            "result": {
-                "contents": [
-                    {
-                        "uri": uri,
-                        "mimeType": "text/plain" if uri == "resource://greeting" else "application/json",
-                        "text": content
-                    }
-                ]
-            }
-        }
+        return encode_cached_response(request_id, body)
     
-    async def handle_prompts_list(self, request_id: int) -> Dict[str, Any]:
+    def handle_prompts_list(self, request_id: int, params: Dict[str, Any]) -> bytes:
         """Handle prompts list request"""
-        return {
-            "jsonrpc": "2.0",
-            "id": request_id,
-            "result": {
-                "prompts": list(self.prompts.values())
-            }
-        }
+        return encode_cached_response(request_id, self._prompts_list_body)
     
-    async def handle_prompt_get(self, request_id: int, params: Dict[str, Any]) -> Dict[str, Any]:
+    def handle_prompt_get(self, request_id: int, params: Dict[str, Any]) -> Any:
         """Handle prompt get request"""
         prompt_name = params.get("name")
-        arguments = params.get("arguments", {})
+        arguments = params.get("arguments", NO_PARAMS)
         
-        if prompt_name == "helpful_assistant":
-            topic = arguments.get("topic", "general assistance")
-            prompt_text = f"You are a helpful assistant specialized in {topic}. Please provide clear, accurate, and helpful responses."
-        else:
-            return {
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "error": {
-                    "code": -32602,
-                    "message": f"Unknown prompt: {prompt_name}"
-                }
-            }
+        prompt = self._prompt_handlers.get(prompt_name)
+        if prompt is None:
+            return encode_error(request_id, UNKNOWN_PROMPT_ERROR, prompt_name)
         
         return {
             "jsonrpc": "2.0",
             "id": request_id,
-            "result": {
-                "description": f"Helpful assistant prompt for {topic}",
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": {
-                            "type": "text",
-                            "text": prompt_text
-                        }
+            "result": prompt(arguments)
+        }
+    
+    def prompt_helpful_assistant(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the helpful assistant prompt for a topic"""
+        topic = arguments.get("topic", "general assistance")
+        prompt_text = f"You are a helpful assistant specialized in {topic}. Please provide clear, accurate, and helpful responses."
+        return {
+            "description": f"Helpful assistant prompt for {topic}",
+            "messages": [
+                {
+                    "role": "system",
+                    "content": {
+                        "type": "text",
+                        "text": prompt_text
                     }
-                ]
-            }
+                }
+            ]
         }
 
-async def run_stdio_server():
-    """Run the MCP server using stdio transport"""
+# Bytes requested from stdin per read
+STDIO_CHUNK_SIZE = 1 << 16
+
+class BlockingStdio:
+    """Stream-style stdin/stdout for platforms where the pipes can't join the event loop"""
+    
+    async def read(self, n: int) -> bytes:
+        """Read whatever stdin has available (up to n bytes) on a worker thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, sys.stdin.buffer.read1, n)
+    
+    def write(self, data: bytes):
+        """Buffer data for stdout"""
+        sys.stdout.buffer.write(data)
+    
+    async def drain(self):
+        """Flush buffered stdout data"""
+        sys.stdout.buffer.flush()
+
+async def open_stdio():
+    """Return a (reader, writer) pair for stdin/stdout driven by the event loop"""
+    # The proactor loop on Windows accepts stdin here but only fails on the first
+    # read, long after this function returned, so go straight to blocking stdio
+    if sys.platform == "win32":
+        stdio = BlockingStdio()
+        return stdio, stdio
+    
+    # Attach stdout first: it doesn't read anything, so if stdin can't be attached
+    # afterwards no loop transport is left competing with BlockingStdio for fd 0
+    loop = asyncio.get_running_loop()
+    try:
+        transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, sys.stdout)
+    except (NotImplementedError, ValueError, OSError) as e:
+        # Redirected regular files can't be watched by the loop
+        logging.info(f"Falling back to blocking stdio: {e}")
+        stdio = BlockingStdio()
+        return stdio, stdio
+    
+    try:
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    except (NotImplementedError, ValueError, OSError) as e:
+        logging.info(f"Falling back to blocking stdin: {e}")
+        return BlockingStdio(), asyncio.StreamWriter(transport, protocol, None, loop)
+    
+    return reader, asyncio.StreamWriter(transport, protocol, reader, loop)
+
+def parse_line(line: bytes) -> Any:
+    """Decode one request line, or return None for a line to skip"""
+    # Every request starts with { or [, so blank and garbage lines can be dropped
+    # on their first byte without paying for a parse attempt
+    if not line:
+        return None
+    first = line[0]
+    if first != 0x7B and first != 0x5B:
+        line = line.lstrip()
+        if not line or (line[0] != 0x7B and line[0] != 0x5B):
+            return None
+    return loads(line)
+
+def process_line(server: MCPServer, line: bytes) -> Any:
+    """Handle one request line and return the encoded response line, if any.
+    
+    When an async tool is involved, an awaitable of that result is returned instead;
+    the blocking server runs it with MCPServer.run_pending, the async server awaits it.
+    """
+    try:
+        request = parse_line(line)
+        if request is None:
+            return None
+        if isinstance(request, list):
+            response = server.handle_batch(request)
+        else:
+            response = server.handle_request(request)
+        
+        if asyncio.iscoroutine(response):
+            return finish_line(response)
+        return encode_line(response)
+        
+    except json.JSONDecodeError as e:
+        logging.error(f"JSON decode error: {e}")
+        return None
+    except Exception as e:
+        return error_line(e)
+
+async def finish_line(response: Awaitable[Any]) -> Optional[bytes]:
+    """Await a response from an async tool and encode it"""
+    try:
+        return encode_line(await response)
+    except Exception as e:
+        return error_line(e)
+
+def encode_line(response: Any) -> Optional[bytes]:
+    """Encode a finished response as one output line, or None if nothing is owed"""
+    if response is None:
+        return None
+    try:
+        return encode_message(response) + b"\n"
+    except Exception as e:
+        return error_line(e)
+
+def error_line(error: Exception) -> bytes:
+    """Log a failed request and build the id-less internal error line for it"""
+    logging.error(f"Error processing request: {error}")
+    return encode_error(None, INTERNAL_ERROR, error) + b"\n"
+
+def process_chunk(server: MCPServer, pending: bytearray, chunk: bytes) -> Iterator[Any]:
+    """Yield process_line() for every complete line in pending + chunk, leaving any
+    partial line in pending. Lazy, so each response is finished before the next line runs."""
+    pending += chunk
+    end = pending.rfind(b"\n")
+    if end < 0:
+        return
+    
+    lines = pending[:end].split(b"\n")
+    del pending[:end + 1]
+    for line in lines:
+        response = process_line(server, line)
+        if response is not None:
+            yield response
+
+def stdin_ready(stdin) -> bool:
+    """Return True if stdin has more bytes waiting, i.e. the client is mid-burst"""
+    try:
+        return bool(select.select([stdin], [], [], 0)[0])
+    except (OSError, ValueError):
+        # Windows can only select() on sockets; flush every time there
+        return False
+
+def run_stdio_server():
+    """Run the MCP server using blocking stdio transport"""
     server = MCPServer()
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    pending = bytearray()
     
-    # Read from stdin and write to stdout
+    # Strict request/response, so a plain blocking loop beats the event loop
     while True:
-        try:
-            # Read line from stdin asynchronously
-            loop = asyncio.get_event_loop()
-            line = await loop.run_in_executor(None, sys.stdin.readline)
-            
-            if not line.strip():
-                continue
-                
-            request = json.loads(line.strip())
-            response = await server.handle_request(request)
-            
-            # Write response to stdout
-            print(json.dumps(response), flush=True)
-            
-        except json.JSONDecodeError as e:
-            logging.error(f"JSON decode error: {e}")
-            continue
-        except EOFError:
+        chunk = stdin.read1(STDIO_CHUNK_SIZE)
+        
+        if not chunk:
             logging.info("EOF received, shutting down")
             break
-        except Exception as e:
-            logging.error(f"Error processing request: {e}")
-            # Send error response if we have a request ID
-            try:
-                error_response = {
-                    "jsonrpc": "2.0",
-                    "id": None,
-                    "error": {
-                        "code": -32603,
-                        "message": f"Internal error: {str(e)}"
-                    }
-                }
-                print(json.dumps(error_response), flush=True)
-            except:
-                pass
+        
+        for response in process_chunk(server, pending, chunk):
+            stdout.write(server.run_pending(response) or b"")
+        
+        # Only flush once the client stops sending, so a burst costs one write
+        if not stdin_ready(stdin):
+            stdout.flush()
+    
+    # A final request without a trailing newline is still answered
+    stdout.write(server.run_pending(process_line(server, pending)) or b"")
+    stdout.flush()
+    server.close()
+
+async def run_stdio_server_async():
+    """Run the MCP server using event-loop driven stdio transport"""
+    server = MCPServer()
+    reader, writer = await open_stdio()
+    pending = bytearray()
+    
+    # Read from stdin in chunks and answer every complete line in one write
+    while True:
+        chunk = await reader.read(STDIO_CHUNK_SIZE)
+        
+        if not chunk:
+            logging.info("EOF received, shutting down")
+            break
+        
+        output = []
+        for response in process_chunk(server, pending, chunk):
+            if asyncio.iscoroutine(response):
+                response = await response
+            if response is not None:
+                output.append(response)
+        
+        if output:
+            writer.write(b"".join(output))
+            await writer.drain()
+    
+    # A final request without a trailing newline is still answered
+    response = process_line(server, pending)
+    if asyncio.iscoroutine(response):
+        response = await response
+    if response is not None:
+        writer.write(response)
+        await writer.drain()
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
-    asyncio.run(run_stdio_server())
+    if len(sys.argv) > 1 and sys.argv[1] == "--async":
+        asyncio.run(run_stdio_server_async())
+    else:
+        run_stdio_server()
@@ -6,88 +6,54 @@ Simple test script to verify MCP server functionality
 import subprocess
 import json
 import sys
-import time
+
+def rpc(server_process, method, request_id, params=None):
+    """Send one JSON-RPC request and return the parsed response, or None if the server went quiet"""
+    request = {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params or {}}
+    server_process.stdin.write(json.dumps(request) + "\n")
+    
+    response_line = server_process.stdout.readline()
+    return json.loads(response_line) if response_line else None
 
 def test_server():
     """Test the MCP server directly"""
     print("Testing MCP server...")
     
-    # Start the server process
+    # Start the server process (line buffered, so each request is flushed on write)
     server_process = subprocess.Popen(
         [sys.executable, "server/server.py"],
         stdin=subprocess.PIPE,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         text=True,
-        bufsize=0
+        bufsize=1
     )
     
     try:
-        # Test initialization
-        init_request = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "initialize",
-            "params": {
+        checks = [
+            ("Initialization", "initialize", {
                 "protocolVersion": "2024-11-05",
                 "capabilities": {},
                 "clientInfo": {
                     "name": "test-client",
                     "version": "1.0.0"
                 }
-            }
-        }
+            }),
+            ("Tools list", "tools/list", None),
+            ("Echo tool", "tools/call", {
+                "name": "echo",
+                "arguments": {"message": "Hello, MCP!"}
+            }),
+        ]
         
-        # Send request
-        server_process.stdin.write(json.dumps(init_request) + "\n")
-        server_process.stdin.flush()
+        for request_id, (label, method, params) in enumerate(checks, 1):
+            response = rpc(server_process, method, request_id, params)
+            if response is None:
+                print(f"❌ No response from {label.lower()}")
+                return
+            print(f"{label} response:", response)
         
-        # Read response
-        response_line = server_process.stdout.readline()
-        if response_line:
-            response = json.loads(response_line.strip())
-            print("Initialization response:", response)
-            
-            # Test tools list
-            tools_request = {
-                "jsonrpc": "2.0",
-                "id": 2,
-                "method": "tools/list"
-            }
-            
-            server_process.stdin.write(json.dumps(tools_request) + "\n")
-            server_process.stdin.flush()
-            
-            tools_response_line = server_process.stdout.readline()
-            if tools_response_line:
-                tools_response = json.loads(tools_response_line.strip())
-                print("Tools list response:", tools_response)
-                
-                # Test echo tool
-                echo_request = {
-                    "jsonrpc": "2.0",
-                    "id": 3,
-                    "method": "tools/call",
-                    "params": {
-                        "name": "echo",
-                        "arguments": {"message": "Hello, MCP!"}
-                    }
-                }
-                
-                server_process.stdin.write(json.dumps(echo_request) + "\n")
-                server_process.stdin.flush()
-                
-                echo_response_line = server_process.stdout.readline()
-                if echo_response_line:
-                    echo_response = json.loads(echo_response_line.strip())
-                    print("Echo tool response:", echo_response)
-                    print("✅ Basic MCP functionality working!")
-                else:
-                    print("❌ No response from echo tool")
-            else:
-                print("❌ No response from tools list")
-        else:
-            print("❌ No response from initialization")
+        print("✅ Basic MCP functionality working!")
     
     except Exception as e:
         print(f"❌ Test failed: {e}")